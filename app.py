@@ -1,27 +1,114 @@
+import itertools
 import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template, redirect, url_for, request, flash, send_from_directory
+from pathlib import Path
+import click
+from flask import Flask, Response, abort, render_template, redirect, url_for, request, flash, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
+from flask_caching import Cache
+from flask_compress import Compress
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, load_only, selectinload
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.utils import secure_filename
 from config import Config
 
 # ------------------ App & DB ------------------
+db = SQLAlchemy()
+cache = Cache()
+compress = Compress()
+login_manager = LoginManager()
+login_manager.login_view = 'login'
+
+def init_app(app):
+    """Create the runtime directories and bind the extensions, once at startup."""
+    Path(app.instance_path).mkdir(parents=True, exist_ok=True)
+    Path(app.config['UPLOAD_FOLDER']).mkdir(parents=True, exist_ok=True)
+    db.init_app(app)
+    cache.init_app(app)
+    compress.init_app(app)
+    login_manager.init_app(app)
+
 app = Flask(__name__, instance_relative_config=True)
 app.config.from_object(Config)
+init_app(app)
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_conn, _):
+    """Per-connection SQLite tuning: WAL for concurrent reads, enforced foreign keys."""
+    if isinstance(dbapi_conn, sqlite3.Connection):
+        cur = dbapi_conn.cursor()
+        cur.execute('PRAGMA journal_mode=WAL')
+        cur.execute('PRAGMA synchronous=NORMAL')
+        cur.execute('PRAGMA temp_store=MEMORY')
+        cur.execute('PRAGMA mmap_size=268435456')
+        cur.execute('PRAGMA foreign_keys=ON')
+        cur.close()
+
+ALLOWED_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".webp", ".gif"})
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a")
+
+_upload_seq = itertools.count()
+_io_pool = ThreadPoolExecutor(max_workers=2)
 
-os.makedirs(os.path.join(os.path.dirname(__file__), 'instance'), exist_ok=True)
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+def allowed_file(filename):
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
+
+def looks_like_image(stream):
+    """Check the leading magic bytes instead of trusting the client's extension."""
+    head = stream.read(12)
+    stream.seek(0)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+    return head.startswith(IMAGE_SIGNATURES)
+
+def save_uploads(project_id, files):
+    """Write the allowed image uploads to disk and return their stored names."""
+    upload_folder = app.config['UPLOAD_FOLDER']
+    saved = []
+    try:
+        for file in files:
+            if file and allowed_file(file.filename) and looks_like_image(file.stream):
+                fname = secure_filename(file.filename)
+                save_name = f"{project_id}_{time.time_ns()}_{next(_upload_seq)}_{fname}"
+                saved.append(save_name)  # before writing, so a partial file is cleaned up too
+                file.save(os.path.join(upload_folder, save_name))
+    except Exception:
+        remove_uploads_later(saved)
+        raise
+    return saved
+
+def commit_project_images(project_id, filenames):
+    """Insert rows for already-saved uploads and commit; drop the files if that fails."""
+    try:
+        if filenames:
+            # one executemany INSERT; add_all would emit INSERT ... RETURNING per row
+            db.session.execute(insert(ProjectImage),
+                               [{'filename': name, 'project_id': project_id} for name in filenames])
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        remove_uploads_later(filenames)
+        raise
 
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp", "gif"}
+def _unlink_many(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def remove_uploads_later(filenames):
+    """Delete stored uploads on a background thread."""
+    paths = [os.path.join(app.config['UPLOAD_FOLDER'], name) for name in filenames]
+    if paths:
+        _io_pool.submit(_unlink_many, paths)
 
 # ------------------ Models ------------------
 class User(db.Model, UserMixin):
@@ -32,16 +119,22 @@ class User(db.Model, UserMixin):
     is_admin = db.Column(db.Boolean, default=False)
 
     def set_password(self, pw):
-        self.password_hash = generate_password_hash(pw)
+        self.password_hash = generate_password_hash(pw, method=app.config['PASSWORD_HASH_METHOD'])
 
     def check_password(self, pw):
         return check_password_hash(self.password_hash, pw)
 
+    def needs_rehash(self):
+        return self.password_hash.split('$', 1)[0] != app.config['PASSWORD_HASH_METHOD']
+
+# Checked against on unknown emails; matches accounts hashed with the configured method
+DUMMY_PASSWORD_HASH = generate_password_hash('dummy-password', method=app.config['PASSWORD_HASH_METHOD'])
+
 class TechLanguage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), unique=True, nullable=False)
     description = db.Column(db.Text, default='')
-    is_active = db.Column(db.Boolean, default=True)
+    is_active = db.Column(db.Boolean, default=True, index=True)
 
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -54,34 +147,57 @@ class Project(db.Model):
     tech_id = db.Column(db.Integer, db.ForeignKey('tech_language.id'), nullable=True)
     tech = db.relationship('TechLanguage', backref=db.backref('projects', lazy=True))
 
+    __table_args__ = (db.Index('ix_project_tech_created', 'tech_id', 'created_at'),)
+
 class ProjectImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(300), nullable=False)
-    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
-    project = db.relationship('Project', backref=db.backref('images', lazy=True))
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'),
+                           nullable=False, index=True)
+    project = db.relationship('Project', backref=db.backref('images', lazy='selectin',
+                                                            cascade='all, delete-orphan',
+                                                            passive_deletes=True))
 
 class Inquiry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    user = db.relationship('User', backref=db.backref('inquiries', lazy=True))
+    user = db.relationship('User', backref=db.backref('inquiries', lazy=True), lazy='raise')
 
     tech_id = db.Column(db.Integer, db.ForeignKey('tech_language.id'), nullable=True)
-    tech = db.relationship('TechLanguage')
+    tech = db.relationship('TechLanguage', lazy='raise')  # query with joinedload()
 
     details = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# ------------------ Cached lookups ------------------
+# Cache plain rows, not mapped instances: cached values outlive the session,
+# so a detached TechLanguage would fail on any lazy attribute access.
+_TECH_COLUMNS = (TechLanguage.id, TechLanguage.name, TechLanguage.description, TechLanguage.is_active)
+
+@cache.memoize(timeout=300)
+def get_active_techs():
+    return db.session.execute(select(*_TECH_COLUMNS)
+                              .where(TechLanguage.is_active)
+                              .order_by(TechLanguage.name.asc())).all()
+
+@cache.memoize(timeout=300)
+def get_all_techs():
+    return db.session.execute(select(*_TECH_COLUMNS).order_by(TechLanguage.name.asc())).all()
+
+def invalidate_tech_cache():
+    cache.delete_memoized(get_active_techs)
+    cache.delete_memoized(get_all_techs)
+
 # ------------------ Login loader ------------------
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
 
 # ------------------ CLI init ------------------
-@app.before_request
 def ensure_admin_seed():
-    """Seed default admin and default techs once DB exists."""
+    """Create tables and seed default admin and default techs."""
     db.create_all()
-    admin = User.query.filter_by(email=app.config['ADMIN_EMAIL']).first()
+    admin = db.session.scalars(select(User).where(User.email == app.config['ADMIN_EMAIL'])).first()
     if not admin:
         admin = User(name='Admin', email=app.config['ADMIN_EMAIL'], is_admin=True)
         admin.set_password(app.config['ADMIN_PASSWORD'])
@@ -95,10 +211,19 @@ def ensure_admin_seed():
             ('C++', 'Performance apps, games'),
             ('Other', 'Describe your requirement')
         ]
-        for name, desc in defaults:
-            if not TechLanguage.query.filter_by(name=name).first():
-                db.session.add(TechLanguage(name=name, description=desc))
+        existing = set(db.session.scalars(select(TechLanguage.name)))
+        missing = [{'name': name, 'description': desc}
+                   for name, desc in defaults if name not in existing]
+        if missing:
+            db.session.execute(insert(TechLanguage), missing)
         db.session.commit()
+        invalidate_tech_cache()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and seed defaults (run once per database)."""
+    ensure_admin_seed()
+    click.echo('Database initialized.')
 
 # ------------------ Auth Routes ------------------
 @app.route('/login', methods=['GET', 'POST'])
@@ -106,8 +231,18 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email', '').strip().lower()
         password = request.form.get('password', '')
-        user = User.query.filter_by(email=email).first()
-        if user and user.check_password(password):
+        user = db.session.scalars(select(User).where(User.email == email)).first()
+        if user:
+            ok = user.check_password(password)
+        else:
+            check_password_hash(DUMMY_PASSWORD_HASH, password)
+            ok = False
+        if ok:
+            if user.needs_rehash():
+                # keeps stored hashes on the configured method, and so costing
+                # the same as the dummy check above
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             flash('Logged in successfully.', 'success')
             return redirect(url_for('index'))
@@ -120,7 +255,7 @@ def register():
         name = request.form.get('name', '')
         email = request.form.get('email', '').strip().lower()
         password = request.form.get('password', '')
-        if User.query.filter_by(email=email).first():
+        if db.session.scalars(select(User.id).where(User.email == email)).first():
             flash('Email already registered', 'warning')
             return redirect(url_for('register'))
         user = User(name=name, email=email)
@@ -141,15 +276,18 @@ def logout():
 # ------------------ Client Views ------------------
 @app.route('/')
 def index():
-    techs = TechLanguage.query.filter_by(is_active=True).order_by(TechLanguage.name.asc()).all()
+    techs = get_active_techs()
     return render_template('client/index.html', techs=techs)
 
 @app.route('/tech/<int:tech_id>')
 def tech_projects(tech_id):
-    tech = TechLanguage.query.get_or_404(tech_id)
+    tech = db.get_or_404(TechLanguage, tech_id)
     if tech.name.lower() == 'other':
         return redirect(url_for('other_request'))
-    projects = Project.query.filter_by(tech_id=tech.id).order_by(Project.created_at.desc()).all()
+    projects = db.session.scalars(select(Project)
+                                  .options(selectinload(Project.images))
+                                  .where(Project.tech_id == tech.id)
+                                  .order_by(Project.created_at.desc())).all()
     return render_template('client/projects.html', tech=tech, projects=projects)
 
 @app.route('/other', methods=['GET', 'POST'])
@@ -169,7 +307,27 @@ def other_request():
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    accel_prefix = app.config['UPLOADS_ACCEL_PREFIX']
+    if accel_prefix:
+        # nginx serves the bytes from an internal location via sendfile(2)
+        path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = Response()
+        del response.headers['Content-Type']  # let nginx pick it from the file
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+        return response
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename,
+                               conditional=True, max_age=app.config['UPLOADS_MAX_AGE'])
+
+@app.after_request
+def cache_uploads(response):
+    # stored names embed a nanosecond timestamp, so their content never changes
+    if request.endpoint == 'uploaded_file' and response.status_code in (200, 304):
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['UPLOADS_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
 
 # ------------------ Admin Views ------------------
 from functools import wraps
@@ -187,9 +345,12 @@ def admin_required(f):
 @login_required
 @admin_required
 def admin_dashboard():
-    total_users = User.query.count()
-    total_projects = Project.query.count()
-    total_inquiries = Inquiry.query.count()
+    # one round-trip for all three totals
+    total_users, total_projects, total_inquiries = db.session.execute(select(
+        select(func.count(User.id)).scalar_subquery(),
+        select(func.count(Project.id)).scalar_subquery(),
+        select(func.count(Inquiry.id)).scalar_subquery(),
+    )).one()
     return render_template('admin/dashboard.html',
                            total_users=total_users,
                            total_projects=total_projects,
@@ -205,23 +366,25 @@ def admin_languages():
         is_active = bool(request.form.get('is_active'))
         if not name:
             flash('Language name required', 'warning')
-        elif TechLanguage.query.filter_by(name=name).first():
+        elif db.session.scalars(select(TechLanguage.id).where(TechLanguage.name == name)).first():
             flash('Language already exists', 'warning')
         else:
             db.session.add(TechLanguage(name=name, description=description, is_active=is_active))
             db.session.commit()
+            invalidate_tech_cache()
             flash('Language added', 'success')
         return redirect(url_for('admin_languages'))
-    techs = TechLanguage.query.order_by(TechLanguage.name.asc()).all()
+    techs = get_all_techs()
     return render_template('admin/languages.html', techs=techs)
 
 @app.route('/admin/languages/<int:tech_id>/toggle')
 @login_required
 @admin_required
 def toggle_language(tech_id):
-    tech = TechLanguage.query.get_or_404(tech_id)
+    tech = db.get_or_404(TechLanguage, tech_id)
     tech.is_active = not tech.is_active
     db.session.commit()
+    invalidate_tech_cache()
     flash('Language visibility updated', 'info')
     return redirect(url_for('admin_languages'))
 
@@ -229,15 +392,23 @@ def toggle_language(tech_id):
 @login_required
 @admin_required
 def admin_projects():
-    projects = Project.query.order_by(Project.created_at.desc()).all()
-    techs = TechLanguage.query.order_by(TechLanguage.name.asc()).all()
+    # the list view never shows long_desc, so leave it out of the SELECT
+    projects = db.session.scalars(
+        select(Project)
+        .options(load_only(Project.id, Project.title, Project.short_desc,
+                           Project.price_quote, Project.created_at, Project.tech_id),
+                 joinedload(Project.tech).load_only(TechLanguage.id, TechLanguage.name),
+                 selectinload(Project.images).load_only(ProjectImage.id, ProjectImage.filename))
+        .order_by(Project.created_at.desc())
+    ).all()
+    techs = get_all_techs()
     return render_template('admin/projects.html', projects=projects, techs=techs)
 
 @app.route('/admin/projects/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def admin_project_new():
-    techs = TechLanguage.query.order_by(TechLanguage.name.asc()).all()
+    techs = get_all_techs()
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
         short_desc = request.form.get('short_desc', '').strip()
@@ -253,17 +424,14 @@ def admin_project_new():
                           price_quote=int(price_quote) if price_quote else None,
                           tech_id=int(tech_id))
         db.session.add(project)
+        db.session.flush()
+        project_id = project.id
         db.session.commit()
 
-        # Handle multiple images
-        files = request.files.getlist('images')
-        for file in files:
-            if file and allowed_file(file.filename):
-                fname = secure_filename(file.filename)
-                save_name = f"{project.id}_{datetime.utcnow().timestamp()}_{fname}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], save_name))
-                db.session.add(ProjectImage(filename=save_name, project=project))
-        db.session.commit()
+        # Handle multiple images: write files with no transaction open, then insert in one commit
+        saved = save_uploads(project_id, request.files.getlist('images'))
+        if saved:
+            commit_project_images(project_id, saved)
 
         flash('Project created', 'success')
         return redirect(url_for('admin_projects'))
@@ -274,26 +442,32 @@ def admin_project_new():
 @login_required
 @admin_required
 def admin_project_edit(project_id):
-    project = Project.query.get_or_404(project_id)
-    techs = TechLanguage.query.order_by(TechLanguage.name.asc()).all()
+    project = db.get_or_404(Project, project_id)
+    techs = get_all_techs()
     if request.method == 'POST':
-        project.title = request.form.get('title', '').strip()
-        project.short_desc = request.form.get('short_desc', '').strip()
-        project.long_desc = request.form.get('long_desc', '').strip()
+        title = request.form.get('title', '').strip()
+        short_desc = request.form.get('short_desc', '').strip()
+        long_desc = request.form.get('long_desc', '').strip()
         price_quote = request.form.get('price_quote')
-        project.price_quote = int(price_quote) if price_quote else None
-        project.tech_id = int(request.form.get('tech_id'))
+        tech_id = request.form.get('tech_id')
 
-        # Optional: add more images
-        files = request.files.getlist('images')
-        for file in files:
-            if file and allowed_file(file.filename):
-                fname = secure_filename(file.filename)
-                save_name = f"{project.id}_{datetime.utcnow().timestamp()}_{fname}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], save_name))
-                db.session.add(ProjectImage(filename=save_name, project=project))
+        if not title or not tech_id:
+            flash('Title and Technology are required', 'warning')
+            return redirect(url_for('admin_project_edit', project_id=project.id))
+        price_quote = int(price_quote) if price_quote else None
+        tech_id = int(tech_id)
 
-        db.session.commit()
+        # Optional: add more images, written once the form is known to be valid
+        # and before any change is flushed
+        saved = save_uploads(project.id, request.files.getlist('images'))
+
+        project.title = title
+        project.short_desc = short_desc
+        project.long_desc = long_desc
+        project.price_quote = price_quote
+        project.tech_id = tech_id
+
+        commit_project_images(project.id, saved)
         flash('Project updated', 'success')
         return redirect(url_for('admin_projects'))
 
@@ -303,16 +477,12 @@ def admin_project_edit(project_id):
 @login_required
 @admin_required
 def admin_project_delete(project_id):
-    project = Project.query.get_or_404(project_id)
-    # delete linked images from disk
-    for img in project.images:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], img.filename))
-        except OSError:
-            pass
-    ProjectImage.query.filter_by(project_id=project.id).delete()
-    db.session.delete(project)
+    project = db.get_or_404(Project, project_id)  # images arrive via their selectin loader
+    filenames = [img.filename for img in project.images]
+    db.session.delete(project)  # images go with it via cascade
     db.session.commit()
+    # delete linked images from disk once the rows are gone
+    remove_uploads_later(filenames)
     flash('Project deleted', 'info')
     return redirect(url_for('admin_projects'))
 
@@ -320,13 +490,11 @@ def admin_project_delete(project_id):
 @login_required
 @admin_required
 def admin_image_delete(image_id):
-    img = ProjectImage.query.get_or_404(image_id)
-    try:
-        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], img.filename))
-    except OSError:
-        pass
+    img = db.get_or_404(ProjectImage, image_id)
+    filename = img.filename
     db.session.delete(img)
     db.session.commit()
+    remove_uploads_later([filename])
     flash('Image removed', 'info')
     return redirect(url_for('admin_projects'))
 
@@ -340,4 +508,6 @@ def inject_social_links():
 
 # ------------------ Run ------------------
 if __name__ == '__main__':
-    app.run(debug=True)
+    with app.app_context():
+        ensure_admin_seed()
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1')
@@ -11,8 +11,33 @@ class Config:
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-me')
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'instance', 'dev.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {'check_same_thread': False},
+        'pool_size': 10,
+        'pool_pre_ping': True,
+    }
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
+    # Text responses only; jpg/png/webp uploads are already compressed.
+    # Disable with COMPRESS_REGISTER=0 when nginx handles gzip/brotli.
+    COMPRESS_REGISTER = os.getenv('COMPRESS_REGISTER', '1') == '1'
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_LEVEL = 4
+    COMPRESS_BR_LEVEL = 4
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/xml', 'application/json',
+                          'application/javascript', 'image/svg+xml']
+    # Werkzeug 3's default, pinned so the cost is explicit. Give the full
+    # method string (e.g. pbkdf2:sha256:120000 for a cheaper dev setup);
+    # accounts are rehashed on their next login when it changes.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB per file
     UPLOAD_FOLDER = UPLOAD_FOLDER
     STATIC_UPLOAD_ROUTE = STATIC_UPLOAD_ROUTE
+    UPLOADS_MAX_AGE = 30 * 24 * 3600  # 30 days
+    # Internal nginx location aliased to UPLOAD_FOLDER, e.g. /protected_uploads/.
+    # When set, /uploads responses are handed off with X-Accel-Redirect.
+    UPLOADS_ACCEL_PREFIX = os.getenv('UPLOADS_ACCEL_PREFIX', '')
+    # Set to 1 behind Apache/lighttpd to serve files via X-Sendfile.
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE') == '1'
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@example.com')
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')